@@ -0,0 +1 @@
+# Puts the repo root on sys.path so tests can import recon_core / pdf_pages.
